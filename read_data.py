@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
-import pexpect
-import time
+import asyncio
+from bleak import BleakClient
+from bleak.exc import BleakError
+import numpy as np
 import logging
-import xml.etree.ElementTree as ET
-from bitarray import bitarray
-import binascii
+from lxml import etree as ET
 from pathlib import Path
 from zipfile import ZipFile
 import sys
+from functools import lru_cache
+import pickle
+import os
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -28,189 +31,295 @@ characteristics = {
     "manufacturer_data": ["5a401531-ab2e-2548-c435-08c300000710", "0x001d"]
 }
 
+# Define statistics commands, sent encoded with the machine key
+COMMAND_LITERALS = {
+    "all_statistics": "2a 00 01 FF FF",
+    "mnt_pct_statistics": "2a 00 08 01 00",
+    "mnt_cnt_statistics": "2a 00 04 01 00",
+}
+
 # Define the Bluetooth device address
 DEVICE = sys.argv[1]
 
-# JuraEncoder class for encoding/decoding Jura-specific data
-class JuraEncoder:
-    def __init__(self):
-        self.base_layout = bitarray('01011011')
-
-    def tojura(self, letter, hex=0):
-        if len(letter) != 1:
-            raise ValueError('Needs a single byte')
-        c = bitarray()
-        c.frombytes(letter.encode())
-        c = c[-8:]
-        c = c[2:4] + c[0:2] + c[6:8] + c[4:6]
-        c = c[4:] + c[:4]
-        bytes = [self.base_layout.copy() for _ in range(4)]
-        hex_code = ""
-        for i in range(4):
-            bytes[i][2] = c[i * 2]
-            bytes[i][5] = c[i * 2 + 1]
-            if hex:
-                hex_code += binascii.hexlify(bytes[i].tobytes()).decode() + " "
-        return hex_code[:-1] if hex else bytes
-
-    def fromjura(self, bytes, hex=0):
-        if hex:
-            bytes = [bitarray('{0:08b}'.format(int(binascii.unhexlify(j)[0]))) for j in bytes.split()]
-        if len(bytes) != 4:
-            raise ValueError('Needs an array of size 4')
-        out = bitarray(8)
-        for i in range(4):
-            out[i * 2] = bytes[i][2]
-            out[i * 2 + 1] = bytes[i][5]
-        out = out[4:] + out[:4]
-        out = out[2:4] + out[0:2] + out[6:8] + out[4:6]
-        return out.tobytes().decode()
-
-# BtEncoder class for encoding/decoding Bluetooth data
-class BtEncoder:
-    def __init__(self):
-        self.numbers1 = [14, 4, 3, 2, 1, 13, 8, 11, 6, 15, 12, 7, 10, 5, 0, 9]
-        self.numbers2 = [10, 6, 13, 12, 14, 11, 1, 9, 15, 7, 0, 5, 3, 2, 4, 8]
-
-    def hexStrToInt(self, hexStr):
-        return [int(hexStr[i:i+2], 16) for i in range(0, len(hexStr), 3)]
-
-    def mod256(self, i):
-        return i % 256
-
-    def shuffle(self, dataNibble, nibbleCount, keyLeftNibbel, keyRightNibbel):
-        i5 = self.mod256(nibbleCount >> 4)
-        tmp1 = self.numbers1[self.mod256(dataNibble + nibbleCount + keyLeftNibbel) % 16]
-        tmp2 = self.numbers2[self.mod256(tmp1 + keyRightNibbel + i5 - nibbleCount - keyLeftNibbel) % 16]
-        tmp3 = self.numbers1[self.mod256(tmp2 + keyLeftNibbel + nibbleCount - keyRightNibbel - i5) % 16]
-        return self.mod256(tmp3 - nibbleCount - keyLeftNibbel) % 16
-
-    def encDecBytes(self, data, key):
-        key = int(key, 16)
-        result = []
-        keyLeftNibbel = key >> 4
-        keyRightNibbel = key & 15
-        nibbelCount = 0
-        for d in data:
-            dataLeftNibbel = d >> 4
-            dataRightNibbel = d & 15
-            resultLeftNibbel = self.shuffle(dataLeftNibbel, nibbelCount, keyLeftNibbel, keyRightNibbel)
-            resultRightNibbel = self.shuffle(dataRightNibbel, nibbelCount + 1, keyLeftNibbel, keyRightNibbel)
-            result.append((resultLeftNibbel << 4) | resultRightNibbel)
-            nibbelCount += 2
-        logging.debug(f"ENCODED {''.join(['%02x' % d for d in data])} AS {''.join(['%02x' % d for d in result])}")
-        return result
-
-    def bruteforce_key(self, data):
-        data = [int(d, 16) for d in data.split()]
-        for key in range(256):
-            key_hex = f"{key:02x}"
-            result = self.encDecBytes(data, key_hex)
-            if result[0] == int(key_hex, 16):
-                logging.debug(f"key: {key_hex}")
-                logging.debug(f"result: {result}")
-                return key_hex
+# Machine definitions shipped next to this script
+RESOURCES = ZipFile(Path(__file__).parent / "resources.zip")
+
+# Directory holding the pickled machine tables extracted from RESOURCES
+CACHE_DIR = Path.home() / ".cache" / "jura"
+# Bump whenever the layout of the cached tables changes
+CACHE_VERSION = 1
+
+# Parse space separated hex bytes (e.g. "2a 00 01") into bytes
+def parse_hex(hex_str):
+    return bytes.fromhex(hex_str)
+
+# Layout of an encoded Jura byte; each pair of payload bits lands on its bits 5 and 2
+JURA_BASE_LAYOUT = 0b01011011
+TOJURA = tuple(
+    bytes(JURA_BASE_LAYOUT | ((b >> (i * 2 + 1)) & 1) << 5 | ((b >> (i * 2)) & 1) << 2 for i in range(4))
+    for b in range(256)
+)
+FROMJURA = tuple(((b >> 5) & 1) << 1 | ((b >> 2) & 1) for b in range(256))
+
+# Encode a single character as 4 Jura bytes
+def tojura(letter, hex=0):
+    if len(letter) != 1:
+        raise ValueError('Needs a single byte')
+    encoded = TOJURA[letter.encode()[-1]]
+    return encoded.hex(" ") if hex else encoded
+
+# Decode 4 Jura bytes back to a single character
+def fromjura(encoded, hex=0):
+    if hex:
+        encoded = parse_hex(encoded)
+    if len(encoded) != 4:
+        raise ValueError('Needs an array of size 4')
+    out = 0
+    for i in range(4):
+        out |= FROMJURA[encoded[i]] << (i * 2)
+    return out.to_bytes(1, 'big').decode()
+
+# Substitution tables used by the Bluetooth nibble shuffle
+NUMBERS1 = np.array([14, 4, 3, 2, 1, 13, 8, 11, 6, 15, 12, 7, 10, 5, 0, 9])
+NUMBERS2 = np.array([10, 6, 13, 12, 14, 11, 1, 9, 15, 7, 0, 5, 3, 2, 4, 8])
+
+# Shuffle one Bluetooth data nibble; also works element-wise on NumPy arrays
+def shuffle(dataNibble, nibbleCount, keyLeftNibbel, keyRightNibbel):
+    i5 = nibbleCount >> 4
+    tmp1 = NUMBERS1[(dataNibble + nibbleCount + keyLeftNibbel) & 15]
+    tmp2 = NUMBERS2[(tmp1 + keyRightNibbel + i5 - nibbleCount - keyLeftNibbel) & 15]
+    tmp3 = NUMBERS1[(tmp2 + keyLeftNibbel + nibbleCount - keyRightNibbel - i5) & 15]
+    return (tmp3 - nibbleCount - keyLeftNibbel) & 15
+
+# shuffle() only depends on nibbleCount modulo 256, so every possible result is precomputed,
+# indexed by [nibbleCount & 0xff, keyLeftNibbel, keyRightNibbel, dataNibble]
+def build_shuffle_table():
+    nibbleCount, keyLeftNibbel, keyRightNibbel, dataNibble = np.ogrid[0:256, 0:16, 0:16, 0:16]
+    return shuffle(dataNibble, nibbleCount, keyLeftNibbel, keyRightNibbel).astype(np.uint8)
+
+SHUFFLE_TABLE = build_shuffle_table()
+
+# Encode/decode Bluetooth data with key into a uint8 array (the operation is its own inverse)
+def enc_dec_array(data, key):
+    key = int(key, 16)
+    table = SHUFFLE_TABLE[:, key >> 4, key & 15]
+    data = np.frombuffer(bytes(data), dtype=np.uint8)
+    nibbelCount = np.arange(0, 2 * len(data), 2) & 0xff
+    result = (table[nibbelCount, data >> 4] << 4) | table[nibbelCount + 1, data & 15]
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"ENCODED {data.tobytes().hex()} AS {result.tobytes().hex()}")
+    return result
+
+# Encode/decode Bluetooth data with key
+def enc_dec_bytes(data, key):
+    return enc_dec_array(data, key).tolist()
+
+# Decode statistics data, combining each group of bytes into one big-endian counter
+def decode_statistics(data, key, group):
+    decoded = enc_dec_array(data, key)
+    counters = np.zeros(-(-len(decoded) // group), dtype=np.int64)
+    for offset in range(group):
+        # A trailing partial group simply gets fewer bytes shifted in
+        column = decoded[offset::group]
+        counters[:len(column)] = (counters[:len(column)] << 8) | column
+    return counters.tolist()
+
+# Find the key the machine used to encode data
+def bruteforce_key(data):
+    # The key is the one that encodes the first byte to itself; try all 256 keys at once
+    keys = np.arange(256)
+    result = (SHUFFLE_TABLE[0, keys >> 4, keys & 15, data[0] >> 4] << 4) | SHUFFLE_TABLE[1, keys >> 4, keys & 15, data[0] & 15]
+    hits = np.flatnonzero(result == keys)
+    if not hits.size:
         return None
-
-# Parse XML file and return root and namespace
-def parse_xml(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    namespace = {'ns': 'http://www.top-tronic.com'}
-    return root, namespace
-
-# Extract product information from XML
-def extract_products(root, namespace):
-    return [{'Code': int(product.get('Code'), 16), 'Name': product.get('Name')} for product in root.findall('.//ns:PRODUCT', namespace)]
-
-# Extract maintenance counters from XML
-def extract_maintenance_counters(root, namespace, command):
-    section = root.find(f'.//ns:BANK[@Command="{command}"]', namespace)
-    return [textitem.get('Type') for textitem in section.findall('ns:TEXTITEM', namespace)]
-
-# Extract alerts from XML
-def extract_alerts(root, namespace):
-    alerts = [None] * (max(int(alert.get('Bit')) for alert in root.findall('.//ns:ALERT', namespace)) + 1)
-    for alert in root.findall('.//ns:ALERT', namespace):
-        alerts[int(alert.get('Bit'))] = alert.get('Name')
-    return alerts
-
-# Set up Bluetooth connection
-def setup_connection(device, characteristics):
-    logging.info("Run gatttool...")
-    child = pexpect.spawn(f"gatttool -b {device} -I -t random")
-    logging.info(f"Connecting to {device}")
-    child.sendline("connect")
-    child.expect("Connection successful", timeout=5)
-    logging.info("Connected!")
-
-    # Read initial data and decode key
-    child.sendline(f"char-read-hnd {characteristics['machine_status'][1]}")
-    child.expect(": ", timeout=5)
-    data = child.readline().decode().strip()
-    logging.debug(f"Initial data: {data}")
-    key_dec = bt_encoder.bruteforce_key(data)
+    key_hex = f"{hits[0]:02x}"
+    logging.debug(f"key: {key_hex}")
+    return key_hex
+
+# Namespace of the machine XML files, in ElementTree tag notation
+NAMESPACE = '{http://www.top-tronic.com}'
+
+# Stream XML document and return the products, maintenance banks and alerts it defines
+def parse_xml(file) -> dict:
+    products = []
+    banks = {}
+    alerts = {}
+    tags = (NAMESPACE + 'PRODUCT', NAMESPACE + 'BANK', NAMESPACE + 'ALERT')
+    for _, elem in ET.iterparse(file, events=('end',), tag=tags):
+        if elem.tag == NAMESPACE + 'PRODUCT':
+            products.append({'Code': int(elem.get('Code'), 16), 'Name': elem.get('Name')})
+        elif elem.tag == NAMESPACE + 'BANK':
+            banks.setdefault(elem.get('Command'), [item.get('Type') for item in elem.iterchildren(NAMESPACE + 'TEXTITEM')])
+        else:
+            alerts[int(elem.get('Bit'))] = elem.get('Name')
+        elem.clear(keep_tail=True)
+        # Drop everything read before this element, on every level, so memory stays flat
+        node = elem
+        while node.getparent() is not None:
+            while node.getprevious() is not None:
+                del node.getparent()[0]
+            node = node.getparent()
+
+    alert_names = [None] * (max(alerts) + 1)
+    for bit, name in alerts.items():
+        alert_names[bit] = name
+    return {"products": products, "banks": banks, "alerts": alert_names}
+
+# Extract product information from machine
+def extract_products(machine):
+    return machine["products"]
+
+# Extract maintenance counters from machine
+def extract_maintenance_counters(machine, command):
+    return machine["banks"].get(command, [])
+
+# Extract alerts from machine
+def extract_alerts(machine):
+    return machine["alerts"]
+
+# Find the characteristic listed under name in the characteristics table
+def find_characteristic(client, characteristics, name):
+    uuid, handle = characteristics[name]
+    matches = [char for char in client.services.characteristics.values() if char.uuid == uuid.lower()]
+    if not matches:
+        raise BleakError(f"Characteristic {name} ({uuid}) not found on {client.address}")
+    # Some UUIDs are shared by several characteristics; the table handle tells them apart.
+    # BlueZ reports the declaration handle, which sits just before the value handle.
+    return min(matches, key=lambda char: abs(char.handle - int(handle, 16)))
+
+# Read initial data from the connected machine and decode key
+async def setup_connection(client, characteristics):
+    data = await client.read_gatt_char(find_characteristic(client, characteristics, 'machine_status'))
+    logging.debug(f"Initial data: {data.hex(' ')}")
+    key_dec = bruteforce_key(data)
     logging.debug(f"Key: {key_dec}")
 
-    data = [int(x, 16) for x in data.split()]
-    decoded = bt_encoder.encDecBytes(data, key_dec)
-    logging.debug(f"Decoded data as HEX: {' '.join(['%02x' % d for d in decoded])}")
+    decoded = enc_dec_bytes(data, key_dec)
+    logging.debug(f"Decoded data as HEX: {bytes(decoded).hex(' ')}")
 
-    return child, key_dec
+    return key_dec
 
 # Encode command with key
 def encode_command(command, key_dec):
-    encoded = bt_encoder.encDecBytes([int(x, 16) for x in command.split()], key_dec)
-    return "".join(["%02x" % d for d in encoded])
+    return bytes(enc_dec_bytes(parse_hex(command), key_dec))
 
 # Read data until a specific value is ready
-def read_data_until_ready(child, uuid, ready_value_index, value):
-    hex_values = []
-    while len(hex_values) < ready_value_index + 1 or hex_values[ready_value_index] == value:
-        child.sendline(f"char-read-uuid {uuid}")
-        child.expect(": ")
-        time.sleep(0.5)
-        data = child.readline().decode().strip()
-        value_part = data.split('value: ')[1].strip()
-        hex_values = value_part.split()
-        logging.debug(f"Read data while waiting to be ready: {value_part}")
-    return value_part
-
-# Read and decode statistics data
-def read_and_decode_statistics(child, command, key_dec, characteristics):
-    child.sendline(f"char-write-req {characteristics['statistics_command'][1]} {command}")
-    read_data_until_ready(child, characteristics['read_stat'][0], 1, "e1")
-    child.sendline(f"char-read-hnd {characteristics['statistics_data'][1]}")
-    child.expect(": ")
-    data = child.readline().decode().strip()
-    logging.debug(f"Statistics data: {data}")
-    data = [int(x, 16) for x in data.split()]
-    decoded = bt_encoder.encDecBytes(data, key_dec)
-    logging.debug(f"Decoded statistics data: {decoded}")
+async def read_data_until_ready(client, characteristics, name, ready_value_index, value, timeout=30):
+    char = find_characteristic(client, characteristics, name)
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+
+    def is_ready(data):
+        return len(data) > ready_value_index and data[ready_value_index] != value
+
+    if "notify" in char.properties:
+        # Wait for the machine to notify the ready value instead of polling for it
+        ready = asyncio.get_running_loop().create_future()
+
+        def on_notify(_, data):
+            if debug:
+                logging.debug(f"Notified data while waiting to be ready: {data.hex(' ')}")
+            if is_ready(data) and not ready.done():
+                ready.set_result(bytes(data))
+
+        await client.start_notify(char, on_notify)
+        try:
+            # The value may have become ready before notifications were enabled
+            data = await client.read_gatt_char(char)
+            if debug:
+                logging.debug(f"Read data while waiting to be ready: {data.hex(' ')}")
+            if is_ready(data):
+                return bytes(data)
+            try:
+                return await asyncio.wait_for(ready, timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"No ready notification from {name} after {timeout}s, polling instead")
+        finally:
+            await client.stop_notify(char)
+
+    data = await client.read_gatt_char(char)
+    if debug:
+        logging.debug(f"Read data while waiting to be ready: {data.hex(' ')}")
+    while not is_ready(data):
+        data = await client.read_gatt_char(char)
+        if debug:
+            logging.debug(f"Read data while waiting to be ready: {data.hex(' ')}")
+    return bytes(data)
+
+# Read and decode statistics data, grouping bytes into counters of group bytes each
+async def read_and_decode_statistics(client, command, key_dec, characteristics, group=1):
+    await client.write_gatt_char(find_characteristic(client, characteristics, 'statistics_command'), command, response=True)
+    await read_data_until_ready(client, characteristics, 'read_stat', 1, 0xe1)
+    data = await client.read_gatt_char(find_characteristic(client, characteristics, 'statistics_data'))
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    if debug:
+        logging.debug(f"Statistics data: {data.hex(' ')}")
+    decoded = decode_statistics(data, key_dec, group)
+    if debug:
+        logging.debug(f"Decoded statistics data: {decoded}")
     return decoded
 
 # Get machine information from resources
+@lru_cache(maxsize=None)
 def get_machine(number: str) -> dict:
-    path = Path(__file__).parent / "resources.zip"
-    with ZipFile(path) as f:
-        with f.open("JOE_MACHINES.TXT") as txt:
-            for line in txt:
-                line = line.decode()
-                if not line.startswith(number):
-                    continue
-                items = line.split(";")
-                break
-        root, namespace = parse_xml(f.open("machinefiles/" + items[2] + ".xml"))
-
-    return {"model": items[1], "root": root, "namespace": namespace}
+    with RESOURCES.open("JOE_MACHINES.TXT") as txt:
+        for line in txt:
+            line = line.decode()
+            if not line.startswith(number):
+                continue
+            items = line.split(";")
+            break
+    with RESOURCES.open("machinefiles/" + items[2] + ".xml") as xml:
+        tables = parse_xml(xml)
+
+    return {"model": items[1], **tables}
+
+# Load machine tables (products, cleaning count, cleaning percent, alerts, model name),
+# from the pickled cache when it is newer than resources.zip
+def load_machine(model_id):
+    cache_path = CACHE_DIR / f"{model_id}.v{CACHE_VERSION}.pkl"
+    # The cache is best effort: anything wrong with it just means rebuilding it from resources.zip
+    try:
+        if cache_path.exists() and cache_path.stat().st_mtime >= Path(RESOURCES.filename).stat().st_mtime:
+            with open(cache_path, "rb") as f:
+                tables = pickle.load(f)
+            if isinstance(tables, tuple) and len(tables) == 5:
+                return tables
+            logging.warning(f"Ignoring machine cache {cache_path}: unexpected contents")
+    except Exception as e:
+        logging.warning(f"Ignoring machine cache {cache_path}: {e!r}")
+
+    machine = get_machine(str(model_id))
+    tables = (
+        extract_products(machine),
+        extract_maintenance_counters(machine, "@TG:43"),
+        extract_maintenance_counters(machine, "@TG:C0"),
+        extract_alerts(machine),
+        machine["model"],
+    )
+    # Write to a temporary file first so an interrupted run never leaves a truncated cache behind
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            pickle.dump(tables, f)
+        os.replace(tmp_path, cache_path)
+    except (OSError, pickle.PickleError) as e:
+        logging.warning(f"Could not write machine cache {cache_path}: {e}")
+        tmp_path.unlink(missing_ok=True)
+    return tables
+
+# Index product names by code, keeping the first product listed for each code
+def index_products(products):
+    product_by_code = {}
+    for product in products:
+        product_by_code.setdefault(product['Code'], product['Name'])
+    return product_by_code
 
 # Log statistics data
-def log_statistics(decoded, products):
-    for i, byte in enumerate(decoded):
-        product_code = i
-        product = next((product for product in products if product['Code'] == product_code), None)
-        if product:
-            product_name = product['Name']
+def log_statistics(decoded, product_by_code):
+    for product_code, byte in enumerate(decoded):
+        product_name = product_by_code.get(product_code)
+        if product_name is not None:
             if byte == 65535:
                 byte = 0
             logging.info(f"Product code: {product_code}, Product name: {product_name}, Byte: {byte}")
@@ -221,72 +330,62 @@ def log_maintenance(decoded, maintenance_list, label):
         if i < len(decoded):
             logging.info(f"{label}: {count}, Value: {decoded[i]}")
 
-# Load characteristics from JSON file
-# Initialize encoders
-bt_encoder = BtEncoder()
-jura_encoder = JuraEncoder()
-
-# Setup Bluetooth connection
-child, key_dec = setup_connection(DEVICE, characteristics)
-
-# Get machine model
-value_part = read_data_until_ready(child, characteristics["manufacturer_data"][0], 2, "3d")
-data = [int(x, 16) for x in value_part.split()]
-logging.debug(f"Data: {data}")
-model_id = data[5] * 256 + data[4]
-logging.debug(f"Model ID: {model_id}")
-decoded = bt_encoder.encDecBytes(data, key_dec)
-logging.debug(f"Decoded statistics data: {decoded}")
-machine = get_machine(str(model_id))
-logging.info(f"Machine model: {machine['model']}")
-
-# Parse XML file and extract necessary information
-root = machine["root"]
-namespace = machine["namespace"]
-
-products = extract_products(root, namespace)
-logging.debug(products)
-cleaning_count = extract_maintenance_counters(root, namespace, "@TG:43")
-cleaning_pct = extract_maintenance_counters(root, namespace, "@TG:C0")
-logging.debug(cleaning_count)
-logging.debug(cleaning_pct)
-alerts = extract_alerts(root, namespace)
-logging.debug(alerts)
-
-# Get alerts
-logging.info("Get alerts")
-value_part = read_data_until_ready(child, characteristics["machine_status"][0], 2, "3d")
-data = [int(x, 16) for x in value_part.split()]
-decoded = bt_encoder.encDecBytes(data, key_dec)
-logging.debug(f"Decoded statistics data: {decoded}")
-
-# Check for active alerts
-for i in range((len(decoded) - 1) * 8):
-    offset_abs = (i >> 3) + 1
-    offset_byte = 7 - (i & 0b111)
-    if (decoded[offset_abs] >> offset_byte) & 0b1:
-        logging.info(f"Alert active. Alert bit: {i} - {alerts[i]}")
-
-# Read product count
-logging.info("Read product count")
-all_statistics = encode_command("2a 00 01 FF FF", key_dec)
-decoded = read_and_decode_statistics(child, all_statistics, key_dec, characteristics)
-decoded = [int("".join(["%02x" % d for d in decoded[i:i+3]]), 16) for i in range(0, len(decoded), 3)]
-logging.debug(f"Current Statistics: {decoded}")
-logging.info(f"Total coffee: {decoded[0]}")
-
-# Log product information
-log_statistics(decoded, products)
-
-# Maintenance percents
-logging.info("Read maintenance percents")
-mnt_pct_statistics = encode_command("2a 00 08 01 00", key_dec)
-decoded = read_and_decode_statistics(child, mnt_pct_statistics, key_dec, characteristics)
-log_maintenance(decoded, cleaning_pct, "Cleaning percent")
-
-# Cleaning count
-logging.info("Read cleaning count")
-mnt_cnt_statistics = encode_command("2a 00 04 01 00", key_dec)
-decoded = read_and_decode_statistics(child, mnt_cnt_statistics, key_dec, characteristics)
-decoded = [int("".join(["%02x" % d for d in decoded[i:i+2]]), 16) for i in range(0, len(decoded), 2)]
-log_maintenance(decoded, cleaning_count, "Cleaning count")
+# Read everything from the machine
+async def main(device):
+    # Setup Bluetooth connection
+    logging.info(f"Connecting to {device}")
+    async with BleakClient(device) as client:
+        logging.info("Connected!")
+        key_dec = await setup_connection(client, characteristics)
+        commands = {name: encode_command(literal, key_dec) for name, literal in COMMAND_LITERALS.items()}
+
+        # Get machine model
+        data = await read_data_until_ready(client, characteristics, "manufacturer_data", 2, 0x3d)
+        logging.debug(f"Data: {data.hex(' ')}")
+        model_id = data[5] * 256 + data[4]
+        logging.debug(f"Model ID: {model_id}")
+        decoded = enc_dec_bytes(data, key_dec)
+        logging.debug(f"Decoded statistics data: {decoded}")
+        products, cleaning_count, cleaning_pct, alerts, model = load_machine(model_id)
+        logging.info(f"Machine model: {model}")
+        logging.debug(products)
+        product_by_code = index_products(products)
+        logging.debug(cleaning_count)
+        logging.debug(cleaning_pct)
+        logging.debug(alerts)
+
+        # Get alerts
+        logging.info("Get alerts")
+        data = await read_data_until_ready(client, characteristics, "machine_status", 2, 0x3d)
+        decoded = enc_dec_bytes(data, key_dec)
+        logging.debug(f"Decoded statistics data: {decoded}")
+
+        # Check for active alerts, visiting only the set bits (alert bit 0 is the MSB of decoded[1])
+        total = (len(decoded) - 1) * 8
+        bits = int.from_bytes(bytes(decoded[1:]), 'big')
+        while bits:
+            pos = bits.bit_length() - 1
+            i = total - 1 - pos
+            logging.info(f"Alert active. Alert bit: {i} - {alerts[i]}")
+            bits ^= 1 << pos
+
+        # Read product count
+        logging.info("Read product count")
+        decoded = await read_and_decode_statistics(client, commands["all_statistics"], key_dec, characteristics, 3)
+        logging.debug(f"Current Statistics: {decoded}")
+        logging.info(f"Total coffee: {decoded[0]}")
+
+        # Log product information
+        log_statistics(decoded, product_by_code)
+
+        # Maintenance percents
+        logging.info("Read maintenance percents")
+        decoded = await read_and_decode_statistics(client, commands["mnt_pct_statistics"], key_dec, characteristics)
+        log_maintenance(decoded, cleaning_pct, "Cleaning percent")
+
+        # Cleaning count
+        logging.info("Read cleaning count")
+        decoded = await read_and_decode_statistics(client, commands["mnt_cnt_statistics"], key_dec, characteristics, 2)
+        log_maintenance(decoded, cleaning_count, "Cleaning count")
+
+asyncio.run(main(DEVICE))